@@ -5,7 +5,7 @@ from typing import List
 
 from dispatch_control.dispatch_schedulers import EquipmentDispatchSchedule
 from dispatch_control.setpoints import SetPoints, SetPointProposal
-from time_series_tools.schedulers import Period
+from time_series_tools.schedulers import Period, TimeGrid
 
 
 @dataclass
@@ -23,6 +23,27 @@ class ParamController:
         } if self.setpoints else {}
         return setpoint_report
 
+    def prepare(self, grid: TimeGrid):
+        """ Precompute schedule states for each timestep of the simulation grid
+        """
+        if self.setpoints:
+            self.setpoints.prepare(grid)
+        if self.primary_dispatch_schedule:
+            self.primary_dispatch_schedule.prepare(grid)
+        if self.secondary_dispatch_schedule:
+            self.secondary_dispatch_schedule.prepare(grid)
+
+    def clear_prepared(self):
+        """ Drop precomputed schedule states, so that schedules are evaluated
+        directly outside of a run
+        """
+        if self.setpoints:
+            self.setpoints.clear_prepared()
+        if self.primary_dispatch_schedule:
+            self.primary_dispatch_schedule.clear_prepared()
+        if self.secondary_dispatch_schedule:
+            self.secondary_dispatch_schedule.clear_prepared()
+
     def set_setpoints(self, setpoint_proposal: SetPointProposal, dt: datetime):
         self.setpoints.set_setpoints(setpoint_proposal, dt)
 
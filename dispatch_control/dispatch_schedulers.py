@@ -1,12 +1,23 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
 
 from dispatch_control.parameters import ParamSetterSchedules
 from equipment.equipment import Dispatch, Storage
-from time_series_tools.schedulers import PeriodSchedule, Period
+from time_series_tools.schedulers import PeriodSchedule, Period, TimeGrid
+from time_series_tools.time_constants import HOUR
+
+# which_setpoint by setpoint code, a bitset of charge allowed (1) and discharge allowed (2)
+SETPOINT_NAMES = ('None', 'charge', 'discharge', 'universal')
+
+OUTSIDE_SCHEDULE_MSG = 'Dispatch {} value must be zero outside {} schedule. ' \
+                       'Error caught at datetime {}'
+ERROR_DT_FORMAT = '%Y/%m/%d %H:%M'
 
 
 @dataclass
@@ -18,6 +29,12 @@ class EquipmentDispatchSchedule:
     discharge_schedule: PeriodSchedule
     equipment: Storage
 
+    _grid: TimeGrid = field(init=False, default=None, repr=False, compare=False)
+    _charge_active: np.ndarray = field(init=False, default=None, repr=False, compare=False)
+    _discharge_active: np.ndarray = field(init=False, default=None, repr=False, compare=False)
+    _sample_rate: timedelta = field(init=False, default=None, repr=False, compare=False)
+    _sample_rate_hours: float = field(init=False, default=None, repr=False, compare=False)
+
     @property
     def charge_rate(self):
         return self.equipment.charge_capacity
@@ -26,24 +43,92 @@ class EquipmentDispatchSchedule:
     def discharge_rate(self):
         return self.equipment.discharge_capacity
 
+    def prepare(self, grid: TimeGrid):
+        """ Precompute whether charge and discharge are scheduled at every
+        timestep of grid. Unlike other prepared schedules these are kept up to
+        date by append_schedule and clear_schedule, as dispatchers rewrite
+        them during dispatch
+        """
+        self.setter_schedule.prepare(grid)
+        if grid is self._grid:
+            return
+        self._grid = grid
+        self._charge_active = self.charge_schedule.period_active_array(grid.index)
+        self._discharge_active = self.discharge_schedule.period_active_array(grid.index)
+
+    def clear_prepared(self):
+        self.setter_schedule.clear_prepared()
+        self._grid = None
+        self._charge_active = None
+        self._discharge_active = None
+        self._sample_rate = None
+        self._sample_rate_hours = None
+
+    def _position(self, dt: datetime):
+        return self._grid.position(dt) if self._grid is not None else None
+
+    @staticmethod
+    def _appended_active(
+            active: np.ndarray,
+            schedule: PeriodSchedule,
+            new_periods: List[Period],
+            index: pd.DatetimeIndex
+    ) -> np.ndarray:
+        # Pauses and always_active override periods, so only rebuild with them
+        if schedule.pause_period or schedule.always_active:
+            return schedule.period_active_array(index)
+        for period in new_periods:
+            active |= period.period_active_array(index)
+        return active
+
     def scheduled_charge(self, dt: datetime):
-        if self.charge_schedule.period_active(dt):
+        i = self._position(dt)
+        active = self._charge_active[i] if i is not None else self.charge_schedule.period_active(dt)
+        if active:
             return self.charge_rate
         else:
             return 0.0
 
     def scheduled_discharge(self, dt: datetime):
-        if self.discharge_schedule.period_active(dt):
+        i = self._position(dt)
+        active = self._discharge_active[i] if i is not None else self.discharge_schedule.period_active(dt)
+        if active:
             return self.discharge_rate
         else:
             return 0.0
 
-    def dispatch_proposal(self, dt, sample_rate: timedelta) -> Dispatch:
-        sample_rate_hours = sample_rate / timedelta(hours=1)
-        return Dispatch(
-            charge=self.scheduled_charge(dt) * sample_rate_hours,
-            discharge=self.scheduled_discharge(dt) * sample_rate_hours
-        )
+    def dispatch_proposal(self, dt, sample_rate: timedelta, out: Dispatch = None) -> Dispatch:
+        """ Scheduled dispatch at dt, written into out where given
+        """
+        # The same sample rate is passed every timestep
+        if sample_rate is not self._sample_rate:
+            self._sample_rate = sample_rate
+            self._sample_rate_hours = sample_rate / HOUR
+        sample_rate_hours = self._sample_rate_hours
+        charge = self.scheduled_charge(dt) * sample_rate_hours
+        discharge = self.scheduled_discharge(dt) * sample_rate_hours
+        if out is None:
+            return Dispatch(charge=charge, discharge=discharge)
+        out.charge = charge
+        out.discharge = discharge
+        return out
+
+    def dispatch_proposal_arrays(
+            self,
+            index: pd.DatetimeIndex,
+            sample_rate: timedelta
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Charge and discharge of dispatch_proposal for each datetime in index
+        """
+        sample_rate_hours = sample_rate / HOUR
+        if self._grid is not None and index is self._grid.index:
+            charge_active, discharge_active = self._charge_active, self._discharge_active
+        else:
+            charge_active = self.charge_schedule.period_active_array(index)
+            discharge_active = self.discharge_schedule.period_active_array(index)
+        charge = np.where(charge_active, self.charge_rate, 0.0)
+        discharge = np.where(discharge_active, self.discharge_rate, 0.0)
+        return charge * sample_rate_hours, discharge * sample_rate_hours
 
     def append_schedule(
             self,
@@ -52,12 +137,23 @@ class EquipmentDispatchSchedule:
     ):
         if charge_periods:
             self.charge_schedule.add_periods(charge_periods)
+            if self._grid is not None:
+                self._charge_active = self._appended_active(
+                    self._charge_active, self.charge_schedule, charge_periods, self._grid.index
+                )
         if discharge_periods:
             self.discharge_schedule.add_periods(discharge_periods)
+            if self._grid is not None:
+                self._discharge_active = self._appended_active(
+                    self._discharge_active, self.discharge_schedule, discharge_periods, self._grid.index
+                )
 
     def clear_schedule(self):
         self.charge_schedule.clear_schedule()
         self.discharge_schedule.clear_schedule()
+        if self._grid is not None:
+            self._charge_active = self.charge_schedule.period_active_array(self._grid.index)
+            self._discharge_active = self.discharge_schedule.period_active_array(self._grid.index)
 
     @classmethod
     def empty_schedule(cls, equipment: Storage):
@@ -80,47 +176,90 @@ class DispatchConstraintSchedule:
     absolute_discharge_limit: float = None
     allow_non_scheduled_dispatch: bool = False
 
+    _grid: TimeGrid = field(init=False, default=None, repr=False, compare=False)
+    _setpoint_codes: np.ndarray = field(init=False, default=None, repr=False, compare=False)
+
     def __post_init__(self):
         if not self.absolute_charge_limit:
             self.absolute_charge_limit = float('inf')
         if not self.absolute_discharge_limit:
             self.absolute_discharge_limit = float('inf')
 
+    def prepare(self, grid: TimeGrid):
+        """ Precompute whether charge and discharge are allowed at every
+        timestep of grid, so that checks during dispatch are array lookups
+        rather than schedule evaluations. Changes made to the schedules
+        afterwards are not reflected until cleared with clear_prepared or prepared again
+        """
+        if grid is self._grid:
+            return
+        charge_allowed, discharge_allowed = self.allowed_arrays(grid.index)
+        self._setpoint_codes = charge_allowed.astype(np.uint8) | (discharge_allowed.astype(np.uint8) << 1)
+        self._grid = grid
+
+    def clear_prepared(self):
+        self._grid = None
+        self._setpoint_codes = None
+
+    def _position(self, dt: datetime):
+        return self._grid.position(dt) if self._grid is not None else None
+
     def allowable_charge(self, dt: datetime) -> float:
+        i = self._position(dt)
+        if i is not None:
+            return self.absolute_charge_limit if self._setpoint_codes[i] & 1 else 0.0
         allowable_charge = self.absolute_charge_limit
         if self.no_charge_period.period_active(dt):
             allowable_charge = 0.0
         return allowable_charge
 
     def allowable_discharge(self, dt: datetime):
+        i = self._position(dt)
+        if i is not None:
+            return self.absolute_discharge_limit if self._setpoint_codes[i] & 2 else 0.0
         allowable_discharge = self.absolute_discharge_limit
         if self.no_discharge_period.period_active(dt):
             allowable_discharge = 0.0
         return allowable_discharge
 
     def all_dispatch_allowed(self, dt: datetime):
+        i = self._position(dt)
+        if i is not None:
+            return self.absolute_discharge_limit if self._setpoint_codes[i] == 3 else 0.0
         return self.allowable_charge(dt) and self.allowable_discharge(dt)
 
+    def allowed_arrays(self, index: pd.DatetimeIndex) -> Tuple[np.ndarray, np.ndarray]:
+        """ Whether charge and discharge are allowed at each datetime in index
+        """
+        if self._grid is not None and index is self._grid.index:
+            return (self._setpoint_codes & 1).astype(bool), (self._setpoint_codes & 2).astype(bool)
+        return (
+            ~self.no_charge_period.period_active_array(index),
+            ~self.no_discharge_period.period_active_array(index)
+        )
+
+    def setpoint_code(self, dt: datetime) -> int:
+        """ Index into SETPOINT_NAMES of the setpoint to use at dt
+        """
+        i = self._position(dt)
+        if i is not None:
+            return self._setpoint_codes[i]
+        return (1 if self.allowable_charge(dt) else 0) + (2 if self.allowable_discharge(dt) else 0)
+
     def which_setpoint(self, dt: datetime) -> str:
         """ Identifies appropriate setpoint to use according to
         given datetime and the schedule
         """
-        which = 'charge' if self.allowable_charge(dt) else 'None'
-        which = 'discharge'if self.allowable_discharge(dt) else which
-        which = 'universal' if self.all_dispatch_allowed(dt) else which
-        return which
+        return SETPOINT_NAMES[self.setpoint_code(dt)]
 
     def validate_dispatch(self, dispatch: Dispatch, dt: datetime):
         if not self.allow_non_scheduled_dispatch:
-            error_msg = 'Dispatch {} value must be zero outside {} schedule. ' \
-                        'Error caught at datetime {}'.format
-            dt_format = '%Y/%m/%d %H:%M'
             if dispatch.charge:
                 if not self.allowable_charge(dt):
-                    raise ValueError(error_msg('charge', 'charge', dt.strftime(dt_format)))
+                    raise ValueError(OUTSIDE_SCHEDULE_MSG.format('charge', 'charge', dt.strftime(ERROR_DT_FORMAT)))
             if dispatch.discharge:
                 if not self.allowable_discharge(dt):
-                    raise ValueError(error_msg('discharge', 'discharge', dt.strftime(dt_format)))
+                    raise ValueError(OUTSIDE_SCHEDULE_MSG.format('discharge', 'discharge', dt.strftime(ERROR_DT_FORMAT)))
 
     @classmethod
     def empty_schedule(cls):
@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
-from time_series_tools.schedulers import EventSchedule, PeriodSchedule
+import numpy as np
+
+from time_series_tools.schedulers import EventSchedule, PeriodSchedule, TimeGrid
 
 
 @dataclass
@@ -14,6 +16,10 @@ class ParamSetterSchedules:
     universal_params: EventSchedule = None
     control_params_pauses: PeriodSchedule = None
 
+    _grid: TimeGrid = field(init=False, default=None, repr=False)
+    _pause: np.ndarray = field(init=False, default=None, repr=False)
+    _due: dict = field(init=False, default=None, repr=False)
+
     def __post_init__(self):
         if not self.universal_params:
             self.universal_params = EventSchedule([])
@@ -24,19 +30,73 @@ class ParamSetterSchedules:
         if not self.control_params_pauses:
             self.control_params_pauses = PeriodSchedule([])
 
+    def prepare(self, grid: TimeGrid):
+        """ Precompute pauses for every timestep of grid so that checks during
+        dispatch are array lookups.
+
+        Due events of each params are evaluated over the whole grid the first
+        time they are checked, in time order and not while paused. Periodic
+        events are stateful, so params that are never checked leave shared
+        events untouched, as they would when checked step by step. Changes made
+        to the schedules afterwards are not reflected until cleared with
+        clear_prepared or prepared again
+        """
+        if grid is self._grid:
+            return
+        self._pause = self.control_params_pauses.period_active_array(grid.index)
+        self._due = {}
+        self._grid = grid
+
+    def due_array(self, params: str) -> np.ndarray:
+        """ Prepared due mask of 'charge', 'discharge' or 'universal' params
+        """
+        if self._grid is None:
+            raise ValueError('Setter schedule must be prepared before due arrays are available')
+        due = self._due.get(params)
+        if due is None:
+            schedule = getattr(self, '{}_params'.format(params))
+            due = self._due[params] = schedule.event_due_array(self._grid.index, ~self._pause)
+        return due
+
+    def clear_prepared(self):
+        self._grid = None
+        self._pause = None
+        self._due = None
+
+    def _position(self, dt: datetime):
+        return self._grid.position(dt) if self._grid is not None else None
+
     def params_pause_due(self, dt: datetime) -> bool:
-        return self.control_params_pauses.period_active(dt)
+        i = self._position(dt)
+        if i is None:
+            return self.control_params_pauses.period_active(dt)
+        return self._pause[i]
 
     def universal_params_due(self, dt: datetime) -> bool:
-        return False if self.params_pause_due(dt) else self.universal_params.event_due(dt)
+        i = self._position(dt)
+        if i is None:
+            return False if self.params_pause_due(dt) else self.universal_params.event_due(dt)
+        return self.due_array('universal')[i]
 
     def charge_params_due(self, dt: datetime) -> bool:
-        return False if self.params_pause_due(dt) else self.charge_params.event_due(dt)
+        i = self._position(dt)
+        if i is None:
+            return False if self.params_pause_due(dt) else self.charge_params.event_due(dt)
+        return self.due_array('charge')[i]
 
     def discharge_params_due(self, dt: datetime) -> bool:
-        return False if self.params_pause_due(dt) else self.discharge_params.event_due(dt)
+        i = self._position(dt)
+        if i is None:
+            return False if self.params_pause_due(dt) else self.discharge_params.event_due(dt)
+        return self.due_array('discharge')[i]
 
     def any_event_due(self, dt: datetime) -> bool:
-        return self.charge_params_due(dt) \
-               or self.discharge_params_due(dt) \
-               or self.universal_params_due(dt)
+        # Position and pause looked up once rather than per params
+        i = self._position(dt)
+        if i is not None:
+            return self.due_array('charge')[i] or self._discharge_due[i] or self._universal_due[i]
+        if self.params_pause_due(dt):
+            return False
+        return self.charge_params.event_due(dt) \
+            or self.discharge_params.event_due(dt) \
+            or self.universal_params.event_due(dt)
@@ -1,13 +1,14 @@
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Union, Tuple
+from typing import NamedTuple, Union, Tuple
+import numpy as np
 import pandas as pd
 
 from dispatch_control.dispatch_schedulers import DispatchConstraintSchedule
 from dispatch_control.parameters import ParamSetterSchedules
 from equipment.equipment import Dispatch
 from time_series_tools.forecasters import PerfectForcaster
-from time_series_tools.schedulers import SpecificEvents
+from time_series_tools.schedulers import SpecificEvents, TimeGrid, hour_bits
 
 
 @dataclass
@@ -33,8 +34,10 @@ class SetpointForecasters:
         )
 
 
-@dataclass
-class DemandScenario:
+class DemandScenario(NamedTuple):
+    """ Demand at dt for SetPoints.dispatch_proposal. Dispatch itself passes
+    demand straight to SetPoints.raw_dispatch_proposal
+    """
     demand: float
     dt: datetime
     balance_energy: float
@@ -46,6 +49,11 @@ class SetPointProposal:
     charge: Union[float, None] = None
     discharge: Union[float, None] = None
 
+    def reset(self):
+        self.universal = None
+        self.charge = None
+        self.discharge = None
+
 
 @dataclass
 class SetPoints:
@@ -55,6 +63,16 @@ class SetPoints:
     discharge_setpoint: float = field(init=False, default=0.0)
     universal_setpoint: float = field(init=False, default=0.0)
 
+    _grid: TimeGrid = field(init=False, default=None, repr=False)
+
+    def prepare(self, grid: TimeGrid):
+        self._grid = grid
+        self.setter_schedule.prepare(grid)
+
+    def clear_prepared(self):
+        self._grid = None
+        self.setter_schedule.clear_prepared()
+
     def charge_due(self, dt):
         return self.setter_schedule.charge_params_due(dt)
 
@@ -64,21 +82,34 @@ class SetPoints:
     def universal_due(self, dt):
         return self.setter_schedule.universal_params_due(dt)
 
+    def raw_dispatch_proposal(self, demand: float, code: int) -> float:
+        """ Raw float dispatch proposal for demand, where code indexes
+        SETPOINT_NAMES for the relevant setpoint
+        """
+        if code == 3:
+            return demand - self.universal_setpoint
+        elif code == 2:
+            return max(0.0, demand - self.discharge_setpoint)
+        elif code == 1:
+            return min(0.0, demand - self.charge_setpoint)
+        return 0.0
+
     def dispatch_proposal(
             self,
             demand_scenario: DemandScenario,
-            schedule: DispatchConstraintSchedule
+            schedule: DispatchConstraintSchedule,
+            out: Dispatch = None
     ) -> Dispatch:
-        """ Identify which setpoint is relevant for dt and propose a dispatch
+        """ Identify which setpoint is relevant for dt and propose a dispatch,
+        written into out where given
         """
-        potential_dispatches = {
-            'universal': demand_scenario.demand - self.universal_setpoint,
-            'charge': min(0.0, demand_scenario.demand - self.charge_setpoint),
-            'discharge': max(0.0, demand_scenario.demand - self.discharge_setpoint),
-            'None': 0.0
-        }
-        raw_proposal = potential_dispatches[schedule.which_setpoint(demand_scenario.dt)]
-        return Dispatch.from_raw_float(raw_proposal)
+        raw_proposal = self.raw_dispatch_proposal(
+            demand_scenario.demand,
+            schedule.setpoint_code(demand_scenario.dt)
+        )
+        if out is None:
+            return Dispatch.from_raw_float(raw_proposal)
+        return out.set_raw_float(raw_proposal)
 
     def add_setter_events(
             self,
@@ -87,11 +118,12 @@ class SetPoints:
             universal_params_dt: datetime = None,
     ):
         if charge_params_dt:
-            self.setter_schedule.charge_params.add_event(SpecificEvents(tuple([charge_params_dt])))
+            self.setter_schedule.charge_params.add_event(SpecificEvents((charge_params_dt,)))
         if discharge_params_dt:
-            self.setter_schedule.discharge_params.add_event(SpecificEvents(tuple([discharge_params_dt])))
+            self.setter_schedule.discharge_params.add_event(SpecificEvents((discharge_params_dt,)))
         if universal_params_dt:
-            self.setter_schedule.universal_params.add_event(SpecificEvents(tuple([universal_params_dt])))
+            self.setter_schedule.universal_params.add_event(SpecificEvents((universal_params_dt,)))
+        self.setter_schedule.clear_prepared()
 
     def universal_forecast(
             self,
@@ -120,6 +152,53 @@ class SetPoints:
             tseries, start_dt
         )
 
+    def _forecast_values(
+            self,
+            forecaster: PerfectForcaster,
+            values: np.ndarray,
+            index: pd.DatetimeIndex,
+            start_dt: datetime
+    ) -> np.ndarray:
+        """ Positional look ahead where values lie on the prepared grid,
+        otherwise a search of the index
+        """
+        grid = self._grid
+        if grid is not None and grid.sample_rate and index is grid.index:
+            i = grid.position(start_dt)
+            if i is not None:
+                return forecaster.look_ahead_arr(values, i, grid.sample_rate)
+        return forecaster.look_ahead_values(values, index, start_dt)
+
+    def universal_forecast_values(
+            self,
+            values: np.ndarray,
+            index: pd.DatetimeIndex,
+            start_dt: datetime
+    ) -> np.ndarray:
+        return self._forecast_values(
+            self.forecasters.universal, values, index, start_dt
+        )
+
+    def charge_forecast_values(
+            self,
+            values: np.ndarray,
+            index: pd.DatetimeIndex,
+            start_dt: datetime
+    ) -> np.ndarray:
+        return self._forecast_values(
+            self.forecasters.charge, values, index, start_dt
+        )
+
+    def discharge_forecast_values(
+            self,
+            values: np.ndarray,
+            index: pd.DatetimeIndex,
+            start_dt: datetime
+    ) -> np.ndarray:
+        return self._forecast_values(
+            self.forecasters.discharge, values, index, start_dt
+        )
+
     def set_setpoints(
             self,
             setpoint_proposal: SetPointProposal,
@@ -137,6 +216,13 @@ class SetPoints:
 class SetPointCap:
     hours: Tuple[int]
     cap: float
+    _hour_mask: int = field(init=False, default=0, repr=False)
+
+    def __post_init__(self):
+        self._hour_mask = hour_bits(self.hours)
+
+    def in_hours(self, dt: datetime) -> bool:
+        return bool((self._hour_mask >> dt.hour) & 1)
 
 
 @dataclass
@@ -145,17 +231,40 @@ class CappedSetPoints(SetPoints):
     discharge_cap: SetPointCap = None
     universal_cap: SetPointCap = None
 
+    _cap_hours: dict = field(init=False, default=None, repr=False)
+
+    def prepare(self, grid: TimeGrid):
+        super().prepare(grid)
+        self._cap_hours = {
+            name: grid.in_hours(cap.hours)
+            for name, cap in (
+                ('charge', self.charge_cap),
+                ('discharge', self.discharge_cap),
+                ('universal', self.universal_cap),
+            ) if cap
+        }
+
+    def clear_prepared(self):
+        super().clear_prepared()
+        self._cap_hours = None
+
+    def in_cap_hours(self, name: str, cap: SetPointCap, dt: datetime) -> bool:
+        i = self._grid.position(dt) if self._grid is not None else None
+        if i is None:
+            return cap.in_hours(dt)
+        return bool(self._cap_hours[name][i])
+
     def set_setpoints(
             self,
             proposal: SetPointProposal,
             dt: datetime = None
     ):
         if self.charge_cap:
-            if dt.hour in self.charge_cap.hours:
+            if self.in_cap_hours('charge', self.charge_cap, dt):
                 self.charge_setpoint = self.charge_cap.cap
         if self.discharge_cap:
-            if dt.hour in self.discharge_cap.hours:
+            if self.in_cap_hours('discharge', self.discharge_cap, dt):
                 self.charge_setpoint = self.discharge_cap.cap
         if self.discharge_cap:
-            if dt.hour in self.universal_cap.hours:
+            if self.in_cap_hours('universal', self.universal_cap, dt):
                 self.universal_setpoint = self.universal_cap.cap
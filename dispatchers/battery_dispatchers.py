@@ -2,12 +2,9 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-import numpy as np
 
-from dispatch_control.setpoints import SetPointProposal
 from dispatchers.dispatchers import StorageDispatcher, WholesalePriceTranchDispatcher
 from equipment.storage import Battery
-from time_series_tools.schedulers import DateRangePeriod
 from optimisers import PeakShave, TOUShiftingCalculator
 from time_series_tools.wholesale_prices import MarketPrices
 
@@ -28,24 +25,25 @@ class PeakShaveBatteryDispatcher(StorageDispatcher):
         )
 
     def propose_setpoint(self, dt: datetime):
-        forecast = self.controller.setpoints.universal_forecast(
-            self.meter.tseries,
+        forecast = self.controller.setpoints.universal_forecast_values(
+            self.column_values(self.meter.tseries, self.dispatch_on),
+            self.meter.tseries.index,
             dt
         )
-        sorted_arr = np.sort(forecast[self.dispatch_on].values)
-        peak_areas = PeakShave.cumulative_peak_areas(sorted_arr)
-        index = PeakShave.peak_area_idx(
-            peak_areas,
+        return PeakShave.peak_shave(
+            forecast,
             self.equipment.available_energy
         )
-        return np.flip(sorted_arr)[index]
 
     def optimise_dispatch_params(self, dt: datetime):
-        proposal = SetPointProposal()
+        proposal = self.setpoint_proposal()
         if self.controller.setpoints.universal_due(dt):
             proposal.universal = self.propose_setpoint(dt)
         self.controller.setpoints.set_setpoints(proposal, dt)
 
+    def params_due_array(self):
+        return self.controller.setpoints.setter_schedule.due_array('universal')
+
 
 @dataclass
 class ConservativePeakShaveComboBatteryController(PeakShaveBatteryDispatcher):
@@ -67,7 +65,7 @@ class ConservativePeakShaveComboBatteryController(PeakShaveBatteryDispatcher):
         )
 
     def optimise_dispatch_params(self, dt: datetime):
-        proposal = SetPointProposal()
+        proposal = self.setpoint_proposal()
         if self.controller.setpoints.universal_due(dt):
             proposal.universal = max(
                 self.propose_setpoint(dt),
@@ -88,23 +86,22 @@ class TouBatteryDispatcher(StorageDispatcher):
         )
 
     def propose_charge_setpoint(self, dt: datetime):
-        forecast = self.controller.setpoints.charge_forecast(
-            self.meter.tseries,
+        demand_arr = self.controller.setpoints.charge_forecast_values(
+            self.column_values(self.meter.tseries, self.dispatch_on),
+            self.meter.tseries.index,
             dt
         )
-        demand_arr = forecast[self.dispatch_on].values
-
         return TOUShiftingCalculator.charge_setpoint(
             demand_arr,
             self.equipment.available_storage
         )
 
     def propose_discharge_setpoint(self, dt: datetime):
-        forecast = self.controller.setpoints.discharge_forecast(
-            self.meter.tseries,
+        demand_arr = self.controller.setpoints.discharge_forecast_values(
+            self.column_values(self.meter.tseries, self.dispatch_on),
+            self.meter.tseries.index,
             dt
         )
-        demand_arr = forecast[self.dispatch_on].values
         return TOUShiftingCalculator.calculate_setpoint(
             demand_arr,
             self.equipment.available_energy
@@ -114,13 +111,17 @@ class TouBatteryDispatcher(StorageDispatcher):
             self,
             dt: datetime,
     ):
-        proposal = SetPointProposal()
+        proposal = self.setpoint_proposal()
         if self.controller.setpoints.charge_due(dt):
             proposal.charge = self.propose_charge_setpoint(dt)
         if self.controller.setpoints.discharge_due(dt):
             proposal.discharge = self.propose_discharge_setpoint(dt)
         self.controller.setpoints.set_setpoints(proposal, dt)
 
+    def params_due_array(self):
+        setter_schedule = self.controller.setpoints.setter_schedule
+        return setter_schedule.due_array('charge') | setter_schedule.due_array('discharge')
+
 
 @dataclass
 class TouPeakShaveComboBatteryController(TouBatteryDispatcher):
@@ -137,7 +138,7 @@ class TouPeakShaveComboBatteryController(TouBatteryDispatcher):
             self,
             dt: datetime,
     ):
-        proposal = SetPointProposal()
+        proposal = self.setpoint_proposal()
         if self.controller.setpoints.charge_due(dt):
             proposal.charge = min(
                 self.propose_charge_setpoint(dt),
@@ -160,7 +161,7 @@ class WholesalePriceTranchBatteryDispatcher(WholesalePriceTranchDispatcher):
 
     def set_dispatch_schedule(self, dt):
         price_forecast = self.market_prices.forecast(dt)
-        sorted_price_tseries = price_forecast.sort_values(by='price')
+        sorted_times = self.price_sorted_index(price_forecast)
 
         if self.meter.sample_rate != self.forecast_resolution:
             price_forecast = price_forecast.resample(self.forecast_resolution).mean()
@@ -168,10 +169,8 @@ class WholesalePriceTranchBatteryDispatcher(WholesalePriceTranchDispatcher):
         number_dispatch_slots = int(self.number_tranches / 2)
         number_dispatch_pairs = min(int(len(price_forecast) / 2), number_dispatch_slots)
 
-        charge_times = sorted_price_tseries.iloc[:number_dispatch_pairs, :].index
-        discharge_times = sorted_price_tseries.iloc[-number_dispatch_pairs:, :].index
-        charge_periods = list([DateRangePeriod(x, x + self.forecast_resolution) for x in charge_times])
-        discharge_periods = list([DateRangePeriod(x, x + self.forecast_resolution) for x in discharge_times])
+        charge_periods = self.tranche_periods(sorted_times[:number_dispatch_pairs])
+        discharge_periods = self.tranche_periods(sorted_times[-number_dispatch_pairs:])
 
         self.controller.update_primary_dispatch_schedule(
             charge_periods,
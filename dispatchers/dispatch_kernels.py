@@ -0,0 +1,89 @@
+import numpy as np
+from numba import njit
+
+from equipment.storage import battery_step
+
+
+@njit(cache=True)
+def battery_dispatch_segment(
+        start: int,
+        stop: int,
+        demand: np.ndarray,
+        primary_charge: np.ndarray,
+        primary_discharge: np.ndarray,
+        secondary_charge: np.ndarray,
+        secondary_discharge: np.ndarray,
+        has_secondary: bool,
+        charge_allowed: np.ndarray,
+        discharge_allowed: np.ndarray,
+        validate_schedule: bool,
+        has_setpoints: bool,
+        charge_setpoint: float,
+        discharge_setpoint: float,
+        universal_setpoint: float,
+        state_of_charge: float,
+        cycle_count: float,
+        storage_capacity: float,
+        round_trip_efficiency: float,
+        charge_limit: float,
+        discharge_limit: float,
+        historical_peak_demand: float,
+        historical_min_demand: float,
+        charge_out: np.ndarray,
+        discharge_out: np.ndarray,
+        state_of_charge_out: np.ndarray,
+        cycle_count_out: np.ndarray,
+):
+    """ StorageDispatcher.dispatch timesteps start to stop for a Battery
+    with fixed setpoints and no special constraints.
+
+    Stops early, before updating any state, at the first timestep whose
+    proposal or dispatch would fail validation so that it can be replayed
+    (and the error raised) step by step. Returns the timestep reached along
+    with the battery state and historical demand at that point
+    """
+    for i in range(start, stop):
+        # Scheduled dispatch, then secondary schedule, then setpoints
+        charge = primary_charge[i]
+        discharge = min(demand[i], primary_discharge[i])
+        if has_secondary and discharge - charge == 0.0:
+            charge = secondary_charge[i]
+            discharge = secondary_discharge[i]
+        if has_setpoints and discharge - charge == 0.0:
+            if charge_allowed[i] and discharge_allowed[i]:
+                raw_proposal = demand[i] - universal_setpoint
+            elif discharge_allowed[i]:
+                raw_proposal = max(0.0, demand[i] - discharge_setpoint)
+            elif charge_allowed[i]:
+                raw_proposal = min(0.0, demand[i] - charge_setpoint)
+            else:
+                raw_proposal = 0.0
+            charge = -min(0.0, raw_proposal)
+            discharge = max(0.0, raw_proposal)
+        if charge < 0.0 or discharge < 0.0 or not min(charge, discharge) == 0.0:
+            return i, state_of_charge, cycle_count, historical_peak_demand, historical_min_demand
+
+        charge, discharge, next_state_of_charge, next_cycle_count = battery_step(
+            charge,
+            discharge,
+            state_of_charge,
+            cycle_count,
+            storage_capacity,
+            round_trip_efficiency,
+            charge_limit,
+            discharge_limit,
+        )
+        if validate_schedule:
+            if (charge != 0.0 and not charge_allowed[i]) or (discharge != 0.0 and not discharge_allowed[i]):
+                return i, state_of_charge, cycle_count, historical_peak_demand, historical_min_demand
+        state_of_charge = next_state_of_charge
+        cycle_count = next_cycle_count
+
+        charge_out[i] = charge
+        discharge_out[i] = discharge
+        state_of_charge_out[i] = state_of_charge
+        cycle_count_out[i] = cycle_count
+        net_demand = demand[i] - (discharge - charge)
+        historical_peak_demand = max(net_demand, historical_peak_demand)
+        historical_min_demand = min(net_demand, historical_min_demand)
+    return stop, state_of_charge, cycle_count, historical_peak_demand, historical_min_demand
@@ -3,17 +3,23 @@ from abc import ABC, abstractmethod
 
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
 
 from dispatch_control.constraints import DispatchConstraints
 from dispatch_control.controllers import ParamController
 from dispatch_control.dispatch_schedulers import DispatchConstraintSchedule
-from dispatch_control.setpoints import DemandScenario
+from dispatch_control.setpoints import DemandScenario, SetPointProposal, SetPoints
+from dispatchers.dispatch_kernels import battery_dispatch_segment
 from equipment.equipment import Equipment, Dispatch, Storage
+from equipment.storage import Battery
 from time_series_tools.metering import DispatchFlexMeter
+from time_series_tools.schedulers import DateRangePeriod, TimeGrid
+from time_series_tools.time_constants import HOUR
 from time_series_tools.wholesale_prices import MarketPrices
 
-from time import time
-
 
 @dataclass
 class Dispatcher(ABC):
@@ -26,7 +32,13 @@ class Dispatcher(ABC):
     dispatch_on: str
 
     historical_peak_demand: float = field(init=False, default=0.0)
-    historical_min_demand: float = field(init=False, default=0.0)
+    historical_min_demand: float = field(init=False, default=float('inf'))
+    # Reused by optimise_dispatch_params rather than allocating a proposal each timestep
+    _proposal_buf: SetPointProposal = field(init=False, default_factory=SetPointProposal, repr=False)
+    # Likewise for proposals within dispatch_timestep, which only live until dispatch_request
+    _dispatch_buf: Dispatch = field(init=False, default_factory=lambda: Dispatch(0.0, 0.0), repr=False)
+    # Meter columns extracted during a dispatch run, keyed by (id(frame), column)
+    _column_values: dict = field(init=False, default=None, repr=False)
 
     def __post_init__(self):
         self._parent_post_init()
@@ -64,8 +76,33 @@ class Dispatcher(ABC):
             universal_params_dt,
         )
 
+    def setpoint_proposal(self) -> SetPointProposal:
+        """ Cleared setpoint proposal buffer - setpoints copy values from it
+        so it is safe to reuse between timesteps
+        """
+        self._proposal_buf.reset()
+        return self._proposal_buf
+
+    def column_values(self, frame: pd.DataFrame, column: str) -> np.ndarray:
+        """ frame[column] as an array, extracted once per dispatch run so that
+        repeated forecasts at the same timestep don't go back to pandas.
+
+        Columns of frames built from 2D arrays are strided views - these are
+        copied to contiguous arrays so that forecast windows scan linearly
+        """
+        if self._column_values is None:
+            return np.ascontiguousarray(frame[column].to_numpy())
+        key = (id(frame), column)
+        if key not in self._column_values:
+            self._column_values[key] = np.ascontiguousarray(frame[column].to_numpy())
+        return self._column_values[key]
+
     def demand_at_t(self, dt: datetime):
-        return self.meter.tseries.loc[dt][self.dispatch_on]
+        tseries = self.meter.tseries
+        # Positional lookup rather than building a row with .loc
+        if tseries.index.is_unique:
+            return self.column_values(tseries, self.dispatch_on)[tseries.index.get_loc(dt)]
+        return tseries.loc[dt][self.dispatch_on]
 
     def setpoint_dispatch_proposal(self, demand_scenario: DemandScenario) -> Dispatch:
         return self.controller.setpoints.dispatch_proposal(
@@ -73,27 +110,36 @@ class Dispatcher(ABC):
             self.dispatch_constraint_schedule
         )
 
-    def scheduled_dispatch_proposal(self, dt: datetime) -> Dispatch:
-        demand = self.demand_at_t(dt)
+    def scheduled_dispatch_proposal(self, dt: datetime, demand: float = None, out: Dispatch = None) -> Dispatch:
+        """ Primary scheduled dispatch at dt, written into out where given
+        """
+        if demand is None:
+            demand = self.demand_at_t(dt)
         proposal = self.controller.primary_dispatch_schedule.dispatch_proposal(
             dt,
-            self.meter.sample_rate
+            self.meter.sample_rate,
+            out
         )
         proposal.discharge = min(demand, proposal.discharge)
         return proposal
 
-    def scheduled_secondary_dispatch_proposal(self, dt: datetime) -> Dispatch:
+    def scheduled_secondary_dispatch_proposal(self, dt: datetime, out: Dispatch = None) -> Dispatch:
         return self.controller.secondary_dispatch_schedule.dispatch_proposal(
             dt,
-            self.meter.sample_rate
+            self.meter.sample_rate,
+            out
         )
 
     def apply_special_constraints(self, proposal: Dispatch) -> Dispatch:
         return self.special_constraints.constrain(proposal)
 
     def update_historical_net_demand(self, net_demand: float):
-        self.historical_peak_demand = max(net_demand, self.historical_peak_demand)
-        self.historical_min_demand = min(net_demand, self.historical_peak_demand)
+        # Conditional expressions give the same results as max() and min()
+        # (including ties and nan) without the builtin call
+        peak = self.historical_peak_demand
+        self.historical_peak_demand = peak if peak > net_demand else net_demand
+        low = self.historical_min_demand
+        self.historical_min_demand = low if low < net_demand else net_demand
 
     def report_dispatch(self, dt: datetime, dispatch: Dispatch):
         self.meter.update_dispatch(
@@ -124,30 +170,180 @@ class StorageDispatcher(Dispatcher):
         """
         pass
 
-    def dispatch(self):
-        self.meter.set_reportables(
-            {**self.controller.reportables, **self.equipment.status()}.keys()
-        )
-        for dt, demand in self.meter.tseries.iterrows():
-            self.optimise_dispatch_params(dt)
-
-            # Only invoke setpoints if no scheduled dispatch
-            dispatch_proposal = self.scheduled_dispatch_proposal(dt)
-            if self.controller.secondary_dispatch_schedule:
-                if dispatch_proposal.no_dispatch:
-                    dispatch_proposal = self.scheduled_secondary_dispatch_proposal(dt)
-            if self.controller.setpoints:
-                if dispatch_proposal.no_dispatch:
-                    demand_scenario = DemandScenario(
-                        demand[self.dispatch_on],
-                        dt,
-                        self.meter.tseries['balance_energy'].loc[dt]
+    def params_due_array(self) -> Union[np.ndarray, None]:
+        """ Timesteps at which optimise_dispatch_params may update dispatch
+        params, once the controller has been prepared. None where they may
+        be updated at any timestep
+
+        Dispatchers returning a mask only have optimise_dispatch_params
+        called where it is set, and are dispatched in segments between
+        updates when the equipment allows (see segment_dispatch_supported)
+        """
+        return None
+
+    def setpoints_fixed_between_updates(self) -> bool:
+        # Exact type only - subclasses may adjust setpoints at every timestep
+        return self.controller.setpoints is None or type(self.controller.setpoints) is SetPoints
+
+    def segment_dispatch_supported(self) -> bool:
+        # Exact types only - subclasses may change dispatch per timestep
+        return type(self.equipment) is Battery \
+            and not self.special_constraints.constraints \
+            and self.setpoints_fixed_between_updates()
+
+    def dispatch_timestep(self, dt: datetime, demand: float) -> Dispatch:
+        # Only invoke setpoints if no scheduled dispatch
+        dispatch_proposal = self.scheduled_dispatch_proposal(dt, demand, self._dispatch_buf)
+        if self.controller.secondary_dispatch_schedule:
+            if dispatch_proposal.no_dispatch:
+                dispatch_proposal = self.scheduled_secondary_dispatch_proposal(dt, self._dispatch_buf)
+        if self.controller.setpoints:
+            if dispatch_proposal.no_dispatch:
+                dispatch_proposal = self._dispatch_buf.set_raw_float(
+                    self.controller.setpoints.raw_dispatch_proposal(
+                        demand,
+                        self.dispatch_constraint_schedule.setpoint_code(dt)
                     )
-                    dispatch_proposal = self.setpoint_dispatch_proposal(demand_scenario)
-            dispatch_proposal = self.apply_special_constraints(dispatch_proposal)
-            dispatch_proposal.validate()
-            dispatch = self.equipment.dispatch_request(dispatch_proposal, self.meter.sample_rate)
-            self.commit_dispatch(dt, dispatch, demand[self.dispatch_on])
+                )
+        dispatch_proposal = self.apply_special_constraints(dispatch_proposal)
+        dispatch_proposal.validate()
+        dispatch = self.equipment.dispatch_request(dispatch_proposal, self.meter.sample_rate)
+
+        self.dispatch_constraint_schedule.validate_dispatch(dispatch, dt)
+        self.update_historical_net_demand(demand - dispatch.net_value)
+        return dispatch
+
+    def record_timestep(self, i: int, dispatch: Dispatch, charge, discharge, reports: dict):
+        charge[i] = dispatch.charge
+        discharge[i] = dispatch.discharge
+        # Equipment status written last so it takes precedence, as in report_dispatch
+        for key, value in self.controller.reportables.items():
+            reports[key][i] = value
+        for key, value in self.equipment.status().items():
+            reports[key][i] = value
+
+    def dispatch_segments(
+            self,
+            index: pd.DatetimeIndex,
+            params_due: np.ndarray,
+            demand_values: list,
+            charge: np.ndarray,
+            discharge: np.ndarray,
+            reports: dict,
+    ):
+        """ Dispatch a Battery through the njit kernel between the timesteps at
+        which params are due, as params are fixed in between
+        """
+        n = len(index)
+        sample_rate = self.meter.sample_rate
+        time_step_hours = sample_rate / HOUR
+        demand = np.ascontiguousarray(self.column_values(self.meter.tseries, self.dispatch_on), dtype=float)
+        primary_charge, primary_discharge = \
+            self.controller.primary_dispatch_schedule.dispatch_proposal_arrays(index, sample_rate)
+        secondary_charge, secondary_discharge = \
+            self.controller.secondary_dispatch_schedule.dispatch_proposal_arrays(index, sample_rate) \
+            if self.controller.secondary_dispatch_schedule else (np.zeros(n), np.zeros(n))
+        charge_allowed, discharge_allowed = self.dispatch_constraint_schedule.allowed_arrays(index)
+        state_of_charge = np.empty(n)
+        cycle_count = np.empty(n)
+
+        bounds = sorted({0, n, *np.flatnonzero(params_due).tolist()})
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            self.optimise_dispatch_params(index[start])
+            setpoints = self.controller.setpoints
+            (
+                reached,
+                self.equipment.state_of_charge,
+                self.equipment.cycle_count,
+                self.historical_peak_demand,
+                self.historical_min_demand,
+            ) = battery_dispatch_segment(
+                start,
+                stop,
+                demand,
+                primary_charge,
+                primary_discharge,
+                secondary_charge,
+                secondary_discharge,
+                bool(self.controller.secondary_dispatch_schedule),
+                charge_allowed,
+                discharge_allowed,
+                not self.dispatch_constraint_schedule.allow_non_scheduled_dispatch,
+                bool(setpoints),
+                setpoints.charge_setpoint if setpoints else 0.0,
+                setpoints.discharge_setpoint if setpoints else 0.0,
+                setpoints.universal_setpoint if setpoints else 0.0,
+                self.equipment.state_of_charge,
+                self.equipment.cycle_count,
+                self.equipment.storage_capacity,
+                self.equipment.round_trip_efficiency,
+                self.equipment.charge_capacity * time_step_hours,
+                self.equipment.discharge_capacity * time_step_hours,
+                self.historical_peak_demand,
+                self.historical_min_demand,
+                charge,
+                discharge,
+                state_of_charge,
+                cycle_count,
+            )
+            for key, value in self.controller.reportables.items():
+                reports[key][start:reached] = [value] * (reached - start)
+            status = self.equipment.status_arrays(
+                state_of_charge[start:reached],
+                cycle_count[start:reached]
+            )
+            for key, values in status.items():
+                reports[key][start:reached] = values.tolist()
+
+            # The kernel stops short at a timestep failing validation - replay
+            # the rest step by step so the error is raised as it would be
+            for i in range(reached, stop):
+                dispatch = self.dispatch_timestep(index[i], demand_values[i])
+                self.record_timestep(i, dispatch, charge, discharge, reports)
+
+    def dispatch(self):
+        self._column_values = {}
+        try:
+            self._dispatch()
+        finally:
+            self._column_values = None
+            # Prepared schedule states only apply during the run
+            self.controller.clear_prepared()
+            self.dispatch_constraint_schedule.clear_prepared()
+
+    def _dispatch(self):
+        reportables = list({**self.controller.reportables, **self.equipment.status()}.keys())
+        self.meter.set_reportables(reportables)
+        # Extract columns once - row-wise pandas access (iterrows/.loc) is slow
+        tseries = self.meter.tseries
+        grid = TimeGrid(tseries.index)
+        self.controller.prepare(grid)
+        self.dispatch_constraint_schedule.prepare(grid)
+        demand_values = self.column_values(tseries, self.dispatch_on).tolist()
+
+        # Outcomes are stored by position and handed to the meter in one go
+        charge = np.empty(len(tseries))
+        discharge = np.empty(len(tseries))
+        reports = {key: [None] * len(tseries) for key in reportables}
+        params_due = self.params_due_array() if self.setpoints_fixed_between_updates() else None
+        if params_due is not None and self.segment_dispatch_supported():
+            self.dispatch_segments(
+                tseries.index,
+                params_due,
+                demand_values,
+                charge,
+                discharge,
+                reports
+            )
+        else:
+            # Params are only looked at where due, if the mask is known
+            params_due = params_due.tolist() if params_due is not None else [True] * len(tseries)
+            for i, (dt, demand) in enumerate(zip(tseries.index, demand_values)):
+                if params_due[i]:
+                    self.optimise_dispatch_params(dt)
+                dispatch = self.dispatch_timestep(dt, demand)
+                self.record_timestep(i, dispatch, charge, discharge, reports)
+        self.meter.update_dispatch_batch(tseries.index, charge, discharge, reports)
         self.meter.consolidate_updates(self.dispatch_on)
 
 
@@ -168,7 +364,7 @@ class WholesalePriceTranchDispatcher(StorageDispatcher):
         forecast resolution and how much storage capacity the battery has (assume smallest
         of charge or discharge rates)
         """
-        time_step_hours = self.forecast_resolution / timedelta(hours=1)
+        time_step_hours = self.forecast_resolution / HOUR
         dispatch_rate = min(
             self.equipment.nominal_charge_capacity,
             self.equipment.nominal_discharge_capacity
@@ -177,9 +373,27 @@ class WholesalePriceTranchDispatcher(StorageDispatcher):
         self.tranche_energy = dispatch_rate * time_step_hours
         # Need positive number of whole tranches as they will be allocated
         # equally to charge and discharge - this will leave remainder unallocated
-        self.number_tranches = int(self.equipment.storage_capacity / self.tranche_energy)
-        if self.number_tranches % 2 != 0:
-            self.number_tranches -= 1
+        self.number_tranches = int(self.equipment.storage_capacity / self.tranche_energy) & ~1
+
+    @staticmethod
+    def price_sorted_index(price_forecast: pd.DataFrame) -> pd.DatetimeIndex:
+        """ Index of price_forecast in ascending order of price - the same
+        order as sort_values(by='price'), without reordering the whole frame
+        """
+        prices = price_forecast['price'].to_numpy()
+        missing = pd.isna(prices)
+        # As sort_values, missing prices go last in their original order
+        order = prices.argsort(kind='quicksort') if not missing.any() else np.concatenate([
+            np.flatnonzero(~missing)[prices[~missing].argsort(kind='quicksort')],
+            np.flatnonzero(missing)
+        ])
+        return price_forecast.index[order]
+
+    def tranche_periods(self, times: pd.DatetimeIndex) -> List[DateRangePeriod]:
+        """ Dispatch period of one forecast resolution from each of times
+        """
+        # Only a handful of times, for which scalar addition beats index arithmetic
+        return [DateRangePeriod(start, start + self.forecast_resolution) for start in times]
 
     @abstractmethod
     def set_dispatch_schedule(self, dt):
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+import numpy as np
+
 from equipment.equipment import Dispatch
 from equipment.settings_adjustments import CompressorSuctionPressure
 from time_series_tools.metering import DispatchFlexMeter
@@ -43,20 +45,30 @@ class CompressorSuctionPressureDispatcher:
         self.repay_schedule.add_period(
             repay_period
         )
-        x = 1
 
     def dispatch(self):
-        for dt, demand in self.meter.tseries.iterrows():
-            if self.setter_schedule.event_due(dt):
+        # Extract the column once - row-wise pandas access (iterrows) is slow
+        tseries = self.meter.tseries
+        demand_values = tseries[self.dispatch_on].to_numpy().tolist()
+        params_due = self.setter_schedule.event_due_array(tseries.index).tolist()
+
+        # Outcomes are stored by position and handed to the meter in one go
+        charge = np.empty(len(tseries))
+        discharge = np.empty(len(tseries))
+        for i, (dt, demand) in enumerate(zip(tseries.index, demand_values)):
+            if params_due[i]:
                 self.optimise_dispatch_params(dt)
             if self.dispatch_schedule.period_active(dt):
-                dispatch = self.setting.apply_setting(demand[self.dispatch_on])
+                dispatch = self.setting.apply_setting(demand)
             else:
                 dispatch = Dispatch.from_raw_float(0.0)
             if self.repay_schedule.period_active(dt):
-                dispatch = self.setting.repay_dispatch(demand[self.dispatch_on])
-            self.commit_dispatch(dt, dispatch, demand[self.dispatch_on])
+                dispatch = self.setting.repay_dispatch(demand)
+            dispatch.validate()
+            charge[i] = dispatch.charge
+            discharge[i] = dispatch.discharge
 
+        self.meter.update_dispatch_batch(tseries.index, charge, discharge)
         self.meter.consolidate_updates(self.dispatch_on)
 
     def report_dispatch(self, dt: datetime, dispatch: Dispatch):
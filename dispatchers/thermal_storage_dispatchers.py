@@ -3,16 +3,12 @@ from datetime import datetime, timedelta
 
 import numpy as np
 
-from dispatch_control.setpoints import SetPointProposal
 from dispatchers.dispatchers import StorageDispatcher, WholesalePriceTranchDispatcher
 from equipment.storage import ThermalStorage
-from optimisers import PeakShave
+from optimisers import sub_load_peak_shave_setpoint
 from time_series_tools.metering import ThermalLoadFlexMeter
-from time_series_tools.schedulers import DateRangePeriod
 from time_series_tools.wholesale_prices import MarketPrices
 
-from time import time
-
 
 @dataclass
 class ThermalStoragePeakShaveDispatcher(StorageDispatcher):
@@ -26,38 +22,35 @@ class ThermalStoragePeakShaveDispatcher(StorageDispatcher):
         )
 
     def propose_setpoint(self, dt: datetime):
-        gross_col = 'gross_mixed_electrical_and_thermal'
-        sub_col = 'subload_energy'
-        balance_col = 'balance_energy'
-        thermal_forecast = self.controller.setpoints.universal_forecast(
-            self.meter.thermal_tseries,
-            dt
-        ).copy()
-        elec_demand = self.controller.setpoints.universal_forecast(
-            self.meter.tseries,
-            dt
-        )
-        thermal_forecast['balance_energy'] = elec_demand['balance_energy']
-        sort_order = np.argsort(elec_demand['demand_energy'])
-        thermal_forecast.reset_index(inplace=True, drop=True)
-        proposal = PeakShave.sub_load_peak_shave_limit(
-            thermal_forecast.iloc[sort_order],
+        forecast = self.controller.setpoints.universal_forecast_values
+        index = self.meter.tseries.index
+        thermal_tseries = self.meter.thermal_tseries
+        tseries = self.meter.tseries
+        gross = forecast(self.column_values(thermal_tseries, 'gross_mixed_electrical_and_thermal'), index, dt)
+        sub = forecast(self.column_values(thermal_tseries, 'subload_energy'), index, dt)
+        balance = forecast(self.column_values(tseries, 'balance_energy'), index, dt)
+        demand = forecast(self.column_values(tseries, 'demand_energy'), index, dt)
+        # Trial thresholds are taken in order of electrical demand
+        sort_order = np.argsort(demand)
+        return sub_load_peak_shave_setpoint(
+            gross[sort_order],
+            balance[sort_order],
+            sub[sort_order],
             self.equipment.available_energy,
-            gross_col,
-            sub_col,
-            balance_col,
         )
-        return proposal
 
     def optimise_dispatch_params(
             self,
             dt: datetime
     ):
         if self.controller.setpoints.universal_due(dt):
-            proposal = SetPointProposal()
+            proposal = self.setpoint_proposal()
             proposal.universal = self.propose_setpoint(dt)
             self.controller.setpoints.set_setpoints(proposal, dt)
 
+    def params_due_array(self):
+        return self.controller.setpoints.setter_schedule.due_array('universal')
+
 
 @dataclass
 class WholesalePriceTranchThermalDispatcher(WholesalePriceTranchDispatcher):
@@ -84,16 +77,13 @@ class WholesalePriceTranchThermalDispatcher(WholesalePriceTranchDispatcher):
         # price_forecast_discharging should only include datetimes
         # where subload is present
         price_forecast_discharging = price_forecast[subload_forecast > 0.0]
-        sorted_price_charging = price_forecast_charging.sort_values(by='price')
-        sorted_price_discharging = price_forecast_discharging.sort_values(by='price')
+        sorted_charging_times = self.price_sorted_index(price_forecast_charging)
+        sorted_discharging_times = self.price_sorted_index(price_forecast_discharging)
 
         number_dispatch_slots = int(self.number_tranches / 2)
         number_dispatch_pairs = min(int(len(price_forecast) / 2), number_dispatch_slots)
-        charge_times = sorted_price_charging.iloc[:number_dispatch_pairs, :].index
-        discharge_times = sorted_price_discharging.iloc[-number_dispatch_pairs:, :].index
-
-        charge_periods = list([DateRangePeriod(x, x + self.forecast_resolution) for x in charge_times])
-        discharge_periods = list([DateRangePeriod(x, x + self.forecast_resolution) for x in discharge_times])
+        charge_periods = self.tranche_periods(sorted_charging_times[:number_dispatch_pairs])
+        discharge_periods = self.tranche_periods(sorted_discharging_times[-number_dispatch_pairs:])
 
         self.controller.update_primary_dispatch_schedule(
             charge_periods,
@@ -21,6 +21,7 @@ class Dispatch:
     float values being above zero (I.e. Discharge should never occur at the
     same time as charge)
     """
+    __slots__ = ('charge', 'discharge')
     charge: float
     discharge: float
 
@@ -62,6 +63,13 @@ class Dispatch:
             discharge=max(0.0, dispatch_value)
         )
 
+    def set_raw_float(self, dispatch_value: float):
+        """ In place equivalent of from_raw_float
+        """
+        self.charge = -min(0.0, dispatch_value)
+        self.discharge = max(0.0, dispatch_value)
+        return self
+
 
 @dataclass
 class EquipmentMetadata:
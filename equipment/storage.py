@@ -2,8 +2,12 @@ from dataclasses import dataclass, field
 from datetime import timedelta
 from typing import Tuple
 
+import numpy as np
+from numba import njit
+
 from equipment.equipment import Storage, Dispatch
 from equipment.state_models import StateBasedProperty
+from time_series_tools.time_constants import HOUR
 
 REPORT_ON = (
     'state_of_charge',
@@ -24,6 +28,39 @@ THERMAL_REPORT_ON = (
 )
 
 
+@njit(cache=True)
+def battery_step(
+        charge_proposal: float,
+        discharge_proposal: float,
+        state_of_charge: float,
+        cycle_count: float,
+        storage_capacity: float,
+        round_trip_efficiency: float,
+        charge_limit: float,
+        discharge_limit: float,
+):
+    """ Kernel equivalent of Battery.dispatch_request for a single timestep.
+    Returns charge and discharge along with the updated state of charge
+    and cycle count
+    """
+    charge = min(
+        charge_proposal,
+        charge_limit,
+        storage_capacity * (1 - state_of_charge)
+    )
+    discharge = min(
+        discharge_proposal,
+        discharge_limit,
+        state_of_charge * storage_capacity
+    )
+    delta_energy = round_trip_efficiency * charge - discharge
+    delta_state_of_charge = delta_energy / storage_capacity
+    if delta_state_of_charge > 0.0:
+        cycle_count += delta_state_of_charge
+    state_of_charge += delta_state_of_charge
+    return charge, discharge, state_of_charge, cycle_count
+
+
 @dataclass
 class Battery(Storage):
     report_on: Tuple[str] = field(default=BATTERY_REPORT_ON, init=False)
@@ -44,7 +81,7 @@ class Battery(Storage):
             proposal: Dispatch,
             sample_rate: timedelta,
     ) -> Dispatch:
-        time_step_hours = sample_rate / timedelta(hours=1)
+        time_step_hours = sample_rate / HOUR
         dispatch = Dispatch(
             charge=min(
                 proposal.charge,
@@ -60,6 +97,18 @@ class Battery(Storage):
         self.update_state(dispatch)
         return dispatch
 
+    def status_arrays(self, state_of_charge: np.ndarray, cycle_count: np.ndarray) -> dict:
+        """ status() for arrays of state of charge and cycle count, e.g. those
+        following each step of dispatch
+        """
+        status = {
+            'state_of_charge': state_of_charge,
+            'available_energy': state_of_charge * self.storage_capacity,
+            'available_storage': self.storage_capacity * (1 - state_of_charge),
+            'cycle_count': cycle_count,
+        }
+        return {x: status[x] for x in self.report_on}
+
 
 @dataclass
 class ThermalStorage(Storage):
@@ -95,7 +144,7 @@ class ThermalStorage(Storage):
             self.cycle_count += delta_state_of_charge
 
     def dispatch_request(self, proposal: Dispatch, sample_rate: timedelta) -> Dispatch:
-        time_step_hours = sample_rate / timedelta(hours=1)
+        time_step_hours = sample_rate / HOUR
         dispatch = Dispatch(
             charge=min(
                 proposal.charge,
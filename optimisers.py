@@ -3,6 +3,103 @@ from dataclasses import dataclass
 
 import numpy as np
 import pandas as pd
+from numba import njit
+
+# Long demand arrays are first shaved against their largest 1/8th before
+# falling back to sorting the whole array
+PARTIAL_SORT_FRACTION = 8
+PARTIAL_SORT_MIN_LENGTH = 512
+
+
+@njit(cache=True)
+def peak_shave_setpoint(sorted_arr: np.ndarray, area: float) -> float:
+    """ Single pass equivalent of PeakShave.cumulative_peak_areas, peak_area_idx
+    and the flipped lookup of the setpoint. Walks down from the peak of the
+    ascending sorted array accumulating the area above each level and returns
+    the first level whose area covers the given area
+    """
+    n = len(sorted_arr)
+    peak_area = 0.0
+    for depth in range(n):
+        if depth > 0:
+            peak_area += (sorted_arr[n - depth] - sorted_arr[n - depth - 1]) * depth
+        if peak_area >= area:
+            # No area to shave (depth 0) falls back to the minimum
+            return sorted_arr[n - depth] if depth > 0 else sorted_arr[0]
+    return sorted_arr[0]
+
+
+@njit(cache=True)
+def sub_load_peak_shave_setpoint(
+        gross_arr: np.ndarray,
+        balance_arr: np.ndarray,
+        sub_arr: np.ndarray,
+        area: float
+) -> float:
+    """ Kernel for PeakShave.sub_load_peak_shave_limit. Arrays share the same
+    ordering and trial thresholds are taken from the end of gross_arr
+    """
+    n = len(gross_arr)
+    for i in range(n - 1, -1, -1):
+        trial_threshold = gross_arr[i]
+        exposed_sub_area = 0.0
+        for j in range(n):
+            exposed_gross = gross_arr[j] - trial_threshold
+            if exposed_gross < 0.0:
+                exposed_gross = 0.0
+            exposed_balance = balance_arr[j] - trial_threshold
+            if exposed_balance < 0.0:
+                exposed_balance = 0.0
+            exposed_sub_area += exposed_gross - exposed_balance
+        if exposed_sub_area >= area:
+            return trial_threshold
+    return max(0.0, sub_arr.min())
+
+
+@njit(cache=True)
+def inverted_peak_shave_setpoint(sorted_arr: np.ndarray, peak: float, area: float) -> float:
+    """ peak_shave_setpoint of peak - sorted_arr without materialising it. The
+    inverted array is sorted by walking sorted_arr from the bottom
+    """
+    n = len(sorted_arr)
+    peak_area = 0.0
+    for depth in range(n):
+        if depth > 0:
+            peak_area += ((peak - sorted_arr[depth - 1]) - (peak - sorted_arr[depth])) * depth
+        if peak_area >= area:
+            return peak - sorted_arr[depth - 1] if depth > 0 else peak - sorted_arr[n - 1]
+    return peak - sorted_arr[n - 1]
+
+
+@njit(cache=True)
+def tou_shifting_cap(demand_arr: np.ndarray, area: float, inverted: bool = False):
+    """ Kernel for the first part of TOUShiftingCalculator.calculate_setpoint.
+    Returns whether the area covers the whole cap above the trough along
+    with the setpoint if so - otherwise the setpoint is found by peak shaving.
+
+    Where inverted, works on demand_arr.max() - demand_arr without
+    materialising it
+    """
+    if inverted:
+        invert_about = demand_arr.max()
+        peak = invert_about - demand_arr.min()
+        trough = invert_about - invert_about
+    else:
+        invert_about = 0.0
+        peak = demand_arr.max()
+        trough = demand_arr.min()
+    if not area:
+        return True, peak
+    cap_area = 0.0
+    for value in demand_arr:
+        if inverted:
+            value = invert_about - value
+        cap_area += value - trough
+    additional_area_required = area - cap_area
+    if additional_area_required > 0.0:
+        total_depth = additional_area_required / len(demand_arr) + (peak - trough)
+        return True, peak - total_depth
+    return False, peak
 
 
 @dataclass
@@ -15,9 +112,9 @@ class PeakShave(SetPointOptimiser):
     @staticmethod
     def cumulative_peak_areas(sorted_arr: np.ndarray):
         delta_energy = np.append(np.diff(sorted_arr), 0)
-        reverse_index = np.array(range(len(sorted_arr) - 1, -1, -1))
+        reverse_index = np.arange(len(sorted_arr) - 1, -1, -1)
         delta_area = delta_energy * reverse_index
-        return np.cumsum(np.flip(delta_area))
+        return np.cumsum(delta_area[::-1])
 
     @staticmethod
     def peak_area_idx(peak_areas, area, max_idx=None):
@@ -35,27 +132,38 @@ class PeakShave(SetPointOptimiser):
             sub_col: str,
             balance_col: str,
     ) -> float:
-        for i, row in sorted_df.iloc[::-1].iterrows():
-            trial_threshold = row[gross_col]
-            exposed_gross = sorted_df[gross_col].values - trial_threshold
-            exposed_gross = np.where(exposed_gross < 0.0, 0.0, exposed_gross)
-            exposed_balance = sorted_df[balance_col].values - trial_threshold
-            exposed_balance = np.where(exposed_balance < 0.0, 0.0, exposed_balance)
-            exposed_sub = exposed_gross - exposed_balance
-            exposed_sub_area = sum(exposed_sub)
-            if exposed_sub_area >= area:
-                return trial_threshold
-        return max(0.0, min(sorted_df[sub_col]))
+        return sub_load_peak_shave_setpoint(
+            sorted_df[gross_col].to_numpy(dtype=float),
+            sorted_df[balance_col].to_numpy(dtype=float),
+            sorted_df[sub_col].to_numpy(dtype=float),
+            area
+        )
+
+    @staticmethod
+    def inverted_peak_shave(demand_arr: np.ndarray, peak: float, area):
+        """ peak_shave of peak - demand_arr, where peak is demand_arr.max(),
+        sorting demand_arr itself rather than an inverted copy
+        """
+        n = len(demand_arr)
+        if n > PARTIAL_SORT_MIN_LENGTH and area > 0:
+            k = n // PARTIAL_SORT_FRACTION
+            bottom = np.sort(np.partition(demand_arr, k - 1)[:k])
+            setpoint = inverted_peak_shave_setpoint(bottom, peak, area)
+            if setpoint > peak - bottom[-1]:
+                return setpoint
+        return inverted_peak_shave_setpoint(np.sort(demand_arr), peak, area)
 
     @staticmethod
     def peak_shave(demand_arr: np.ndarray, area):
-        sorted_arr = np.sort(demand_arr)
-        peak_areas = PeakShave.cumulative_peak_areas(sorted_arr)
-        index = PeakShave.peak_area_idx(
-            peak_areas,
-            area
-        )
-        return np.flip(sorted_arr)[index]
+        n = len(demand_arr)
+        if n > PARTIAL_SORT_MIN_LENGTH and area > 0:
+            k = n // PARTIAL_SORT_FRACTION
+            top = np.sort(np.partition(demand_arr, n - k)[n - k:])
+            setpoint = peak_shave_setpoint(top, area)
+            # Setpoint only falls to the smallest value when the area isn't covered
+            if setpoint > top[0]:
+                return setpoint
+        return peak_shave_setpoint(np.sort(demand_arr), area)
 
 
 @dataclass
@@ -84,26 +192,18 @@ class TOUShiftingCalculator(SetPointOptimiser):
 
     @staticmethod
     def calculate_setpoint(demand_arr: np.ndarray, area: float):
-        setpoint = demand_arr.max()
-        if area:
-            cap_area = TOUShiftingCalculator.cap_area(demand_arr)
-            additional_area_required = area - cap_area
-            if additional_area_required > 0.0:
-                additional_depth_required = TOUShiftingCalculator.additional_depth(
-                    demand_arr,
-                    additional_area_required
-                )
-                total_depth = \
-                    additional_depth_required + TOUShiftingCalculator.cap_height(demand_arr)
-                setpoint = demand_arr.max() - total_depth
-            else:
-                setpoint = PeakShave.peak_shave(demand_arr, area)
-        return setpoint
+        covered, setpoint = tou_shifting_cap(demand_arr, area)
+        if covered:
+            return setpoint
+        # Sorting stays in numpy, which is faster than numba's sort
+        return PeakShave.peak_shave(demand_arr, area)
 
     @staticmethod
     def charge_setpoint(demand_arr: np.ndarray, area: float):
-        inverted_arr = TOUShiftingCalculator.inverted_arr(demand_arr)
-        return demand_arr.max() - TOUShiftingCalculator.calculate_setpoint(
-            inverted_arr,
-            area
-        )
+        """ calculate_setpoint for the inverted demand, i.e. filling troughs
+        """
+        peak = demand_arr.max()
+        covered, setpoint = tou_shifting_cap(demand_arr, area, True)
+        if not covered:
+            setpoint = PeakShave.inverted_peak_shave(demand_arr, peak, area)
+        return peak - setpoint
@@ -64,10 +64,8 @@ class FlexPlotter:
         meter['datetime_str'] = meter['datetime'].apply(lambda x: x.strftime('%Y-%m-%d %H:%M:%S'))
 
     def combine_meters(self):
-        flexed_df = self.flexed_tseries.copy()
-        flexed_df.reset_index(inplace=True, drop=True)
-        base_df = self.base_tseries.copy()
-        base_df.reset_index(inplace=True, drop=True)
+        flexed_df = self.flexed_tseries.reset_index(drop=True)
+        base_df = self.base_tseries.reset_index(drop=True)
         self.categorical_combined_data = pd.concat(
             [flexed_df, base_df],
             axis=0
@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import timedelta, datetime
+from typing import Dict
 
+import numpy as np
 import pandas as pd
 
+from time_series_tools.time_constants import MINUTE_NS
+
 
 @dataclass
 class Forecaster(ABC):
@@ -17,9 +21,21 @@ class Forecaster(ABC):
     ) -> pd.DataFrame:
         pass
 
+    def look_ahead_values(
+        self,
+        values: np.ndarray,
+        index: pd.DatetimeIndex,
+        start_datetime: datetime,
+    ) -> np.ndarray:
+        """ Forecast of a single column given as an array aligned with index
+        """
+        return self.look_ahead(pd.Series(values, index=index), start_datetime).to_numpy()
+
 
 @dataclass
 class PerfectForcaster(Forecaster):
+    _window_steps: Dict[timedelta, int] = field(init=False, default_factory=dict, repr=False)
+
     def look_ahead(
         self,
         time_series: pd.DataFrame,
@@ -27,4 +43,51 @@ class PerfectForcaster(Forecaster):
     ):
         fmt = '%Y-%m-%d %H:%M'
         end_time = start_datetime + self.window
-        return time_series[start_datetime.strftime(fmt): end_time.strftime(fmt)]
\ No newline at end of file
+        return time_series[start_datetime.strftime(fmt): end_time.strftime(fmt)]
+
+    def look_ahead_slice(
+        self,
+        index: pd.DatetimeIndex,
+        start_datetime: datetime,
+    ) -> slice:
+        """ Positional equivalent of look_ahead for a time series with the given
+        (sorted) index. As with the minute resolution label slice, both ends of
+        the window are inclusive
+        """
+        start_ns = pd.Timestamp(start_datetime).value
+        end_ns = start_ns + pd.Timedelta(self.window).value
+        start_ns -= start_ns % MINUTE_NS
+        end_ns -= end_ns % MINUTE_NS
+        index_ns = index.asi8
+        return slice(
+            index_ns.searchsorted(start_ns),
+            index_ns.searchsorted(end_ns + MINUTE_NS)
+        )
+
+    def look_ahead_values(
+        self,
+        values: np.ndarray,
+        index: pd.DatetimeIndex,
+        start_datetime: datetime,
+    ) -> np.ndarray:
+        return values[self.look_ahead_slice(index, start_datetime)]
+
+    def window_steps(self, sample_rate: timedelta) -> int:
+        """ Number of samples in the look ahead window of a time series with
+        a fixed sample rate of whole minutes
+        """
+        if sample_rate not in self._window_steps:
+            window = self.window - self.window % timedelta(minutes=1)
+            self._window_steps[sample_rate] = window // sample_rate + 1
+        return self._window_steps[sample_rate]
+
+    def look_ahead_arr(
+        self,
+        arr: np.ndarray,
+        i: int,
+        sample_rate: timedelta,
+    ) -> np.ndarray:
+        """ look_ahead from position i of an array with a fixed sample rate
+        of whole minutes, aligned to the minute
+        """
+        return arr[i:i + self.window_steps(sample_rate)]
@@ -10,6 +10,7 @@ import numpy as np
 from ts_tariffs.sites import MeterData, MeterPlotConfig
 
 from equipment.equipment import Dispatch
+from time_series_tools.time_constants import HOUR
 from validators import Validator
 
 POWER_METER_COLS = (
@@ -62,11 +63,10 @@ class Converter:
             sample_rate: timedelta,
             subload_series: pd.Series = None
     ) -> pd.DataFrame:
-        energy_series.rename('demand_energy', inplace=True)
-        df = pd.DataFrame(energy_series)
+        df = energy_series.to_frame('demand_energy')
         df['demand_power'] = Converter.energy_to_power(
             df['demand_energy'],
-            sample_rate / timedelta(hours=1)
+            sample_rate / HOUR
         )
         df['demand_apparent'] = Converter.power_to_apparent(
             df['demand_power'],
@@ -99,6 +99,24 @@ class DispatchFlexMeter(MeterData):
     ):
         pass
 
+    def update_dispatch_batch(
+            self,
+            index: pd.DatetimeIndex,
+            charge: np.ndarray,
+            discharge: np.ndarray,
+            other: Dict[str, Union[np.ndarray, list]] = None,
+    ):
+        """ Record the dispatch for a run of timesteps at once, as if by
+        update_dispatch for each timestep in turn
+        """
+        other = other or {}
+        for i, dt in enumerate(index):
+            self.update_dispatch(
+                dt,
+                Dispatch(charge[i], discharge[i]),
+                {key: value[i] for key, value in other.items()}
+            )
+
     @abstractmethod
     def consolidate_updates(self, dispatch_on: str):
         pass
@@ -158,16 +176,32 @@ class PowerFlexMeter(DispatchFlexMeter):
             for key, value in other.items():
                 self._updater_arrays[key].append(value)
 
-    def consolidate_updates(self, dispatch_on: str):
-        self.dispatch_tseries['charge'] = self._updater_arrays['charge']
-        self.dispatch_tseries['discharge'] = self._updater_arrays['discharge']
-        self.dispatch_tseries['net'] = self._updater_arrays['net']
-        self.dispatch_tseries['flexed_net_energy'] = \
-            self.tseries[dispatch_on] - self.dispatch_tseries['net']
+    def update_dispatch_batch(
+            self,
+            index: pd.DatetimeIndex,
+            charge: np.ndarray,
+            discharge: np.ndarray,
+            other: Dict[str, Union[np.ndarray, list]] = None,
+    ):
+        self._updater_arrays['charge'].extend(charge)
+        self._updater_arrays['discharge'].extend(discharge)
+        self._updater_arrays['net'].extend(np.subtract(discharge, charge))
+        if other:
+            for key, value in other.items():
+                self._updater_arrays[key].extend(value)
 
+    def consolidate_updates(self, dispatch_on: str):
+        net = np.asarray(self._updater_arrays['net'], dtype=float)
+        columns = {
+            'charge': self._updater_arrays['charge'],
+            'discharge': self._updater_arrays['discharge'],
+            'net': net,
+            'flexed_net_energy': self.tseries[dispatch_on].to_numpy() - net,
+        }
         if self._reportables:
             for key in self._reportables:
-                self.dispatch_tseries[key] = self._updater_arrays[key]
+                columns[key] = self._updater_arrays[key]
+        self.dispatch_tseries = pd.DataFrame(columns, index=self.tseries.index)
 
     def calculate_flexed_tseries(
             self,
@@ -273,13 +307,31 @@ class ThermalLoadFlexMeter(DispatchFlexMeter):
             for key, value in other.items():
                 self._updater_arrays[key].append(value)
 
-    def consolidate_updates(self, dispatch_on: str):
-        self.thermal_dispatch_tseries.index = self._updater_arrays['dt']
-        self.thermal_dispatch_tseries['charge'] = self._updater_arrays['thermal_dispatch_tseries_charge']
-        self.thermal_dispatch_tseries['discharge'] = self._updater_arrays['thermal_dispatch_tseries_discharge']
+    def update_dispatch_batch(
+            self,
+            index: pd.DatetimeIndex,
+            charge: np.ndarray,
+            discharge: np.ndarray,
+            other: Dict[str, Union[np.ndarray, list]] = None,
+    ):
+        self._updater_arrays['dt'].extend(index)
+        self._updater_arrays['thermal_dispatch_tseries_charge'].extend(charge)
+        self._updater_arrays['thermal_dispatch_tseries_discharge'].extend(discharge)
+        if other:
+            for key, value in other.items():
+                self._updater_arrays[key].extend(value)
 
+    def consolidate_updates(self, dispatch_on: str):
+        columns = {
+            'charge': self._updater_arrays['thermal_dispatch_tseries_charge'],
+            'discharge': self._updater_arrays['thermal_dispatch_tseries_discharge'],
+        }
         for key in self._reportables:
-            self.thermal_dispatch_tseries[key] = self._updater_arrays[key]
+            columns[key] = self._updater_arrays[key]
+        self.thermal_dispatch_tseries = pd.DataFrame(
+            columns,
+            index=pd.DatetimeIndex(self._updater_arrays['dt'])
+        )
 
         self.electrical_dispatch_tseries['charge'] = Converter.thermal_to_electrical(
             self.thermal_dispatch_tseries['charge'],
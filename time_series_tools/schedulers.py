@@ -1,16 +1,84 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Union
 from datetime import timedelta, datetime
 from dataclasses import dataclass, field
+from bisect import bisect_right
+from itertools import accumulate
 import calendar
 
+import numpy as np
+import pandas as pd
+
+from time_series_tools.time_constants import MINUTE_NS
+
 WEEKEND_DAYS = ['saturday', 'sunday']
 ALL_DAYS = tuple([x.lower() for x in list(calendar.day_name)])
 WEEKDAYS = tuple([x for x in ALL_DAYS if x not in WEEKEND_DAYS])
 
 
+def day_hours(hours: Tuple[int]) -> List[int]:
+    """ Hours of the day in hours - any others never match a datetime's hour
+    """
+    return [int(hour) for hour in set(hours) if hour in range(24)]
+
+
+def hour_bits(hours: Tuple[int]) -> int:
+    """ Mask with bit h set for each hour of the day h in hours
+    """
+    return sum(1 << hour for hour in day_hours(hours))
+
+
+def hour_lookup(hours: Tuple[int]) -> np.ndarray:
+    """ Length 24 lookup of whether each hour of the day is in hours
+    """
+    lookup = np.zeros(24, dtype=bool)
+    lookup[day_hours(hours)] = True
+    return lookup
+
+
+@dataclass
+class TimeGrid:
+    """ Fixed simulation index against which schedule states can be
+    precomputed and then looked up by datetime
+    """
+    index: pd.DatetimeIndex
+    # Keyed on int64 nanoseconds, which hash much faster than Timestamps
+    positions: Dict[int, int] = field(init=False, repr=False)
+    hours: np.ndarray = field(init=False, repr=False)
+    tz_aware: bool = field(init=False, repr=False)
+    # Set where the index is evenly spaced in whole minutes
+    sample_rate: Union[timedelta, None] = field(init=False, default=None)
+
+    def __post_init__(self):
+        self.positions = {ns: i for i, ns in enumerate(self.index.asi8.tolist())}
+        self.tz_aware = self.index.tz is not None
+        self.hours = self.index.hour.to_numpy(dtype=np.int8)
+        index_ns = self.index.asi8
+        if len(index_ns) > 1:
+            steps = np.diff(index_ns)
+            if steps[0] > 0 and steps[0] % MINUTE_NS == 0 \
+                    and (steps == steps[0]).all() and not (index_ns % MINUTE_NS).any():
+                self.sample_rate = pd.Timedelta(steps[0]).to_pytimedelta()
+
+    def __len__(self):
+        return len(self.index)
+
+    def position(self, dt: datetime) -> Union[int, None]:
+        if type(dt) is not pd.Timestamp:
+            dt = pd.Timestamp(dt)
+        # Naive and tz aware datetimes never match, as with Timestamp equality
+        if (dt.tzinfo is not None) is not self.tz_aware:
+            return None
+        return self.positions.get(dt.value)
+
+    def in_hours(self, hours: Tuple[int]) -> np.ndarray:
+        """ Mask of datetimes in the index whose hour is in hours
+        """
+        return hour_lookup(hours)[self.hours]
+
+
 @dataclass
 class DailyHours(ABC):
     hours: Tuple[int]
@@ -26,6 +94,10 @@ class DailyHours(ABC):
     weekends: bool = False
     weekdays: bool = False
 
+    # Bit h set for each hour and bit d for each relevant day (0 = monday)
+    _hour_mask: int = field(init=False, default=0, repr=False)
+    _day_mask: int = field(init=False, default=0, repr=False)
+
     def __post_init__(self):
         if self.all_days:
             for day in ALL_DAYS:
@@ -36,13 +108,26 @@ class DailyHours(ABC):
         if self.weekdays:
             for day in WEEKDAYS:
                 setattr(self, day, True)
+        self._hour_mask = hour_bits(self.hours)
+        self._day_mask = sum(
+            1 << i for i, day in enumerate(ALL_DAYS) if getattr(self, day)
+        )
 
     @staticmethod
     def day_str(dt):
         return dt.strftime('%A').lower()
 
     def relevant_day(self, dt):
-        return getattr(self, self.day_str(dt))
+        return bool((self._day_mask >> dt.weekday()) & 1)
+
+    def relevant_hour(self, dt):
+        return bool((self._hour_mask >> dt.hour) & 1)
+
+    def active_array(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """ relevant_day and relevant_hour for each datetime in index
+        """
+        day_lookup = np.array([bool((self._day_mask >> day) & 1) for day in range(7)])
+        return hour_lookup(self.hours)[index.hour] & day_lookup[index.weekday]
 
 
 @dataclass
@@ -51,6 +136,16 @@ class EventOccurrence(ABC):
     def is_due(self, dt: datetime):
         pass
 
+    def is_due_array(self, index: pd.DatetimeIndex, where: np.ndarray = None) -> np.ndarray:
+        """ is_due evaluated in order for each datetime in index. Where a mask
+        is given, datetimes outside of it are not evaluated and are never due
+        """
+        due = np.zeros(len(index), dtype=bool)
+        positions = range(len(index)) if where is None else np.flatnonzero(where)
+        for i in positions:
+            due[i] = self.is_due(index[i])
+        return due
+
 
 @dataclass
 class PeriodicEvents(EventOccurrence):
@@ -68,6 +163,25 @@ class PeriodicEvents(EventOccurrence):
             self.next_periodic_event = dt + self.period
         return due
 
+    def is_due_array(self, index: pd.DatetimeIndex, where: np.ndarray = None) -> np.ndarray:
+        if not index.is_monotonic_increasing:
+            return super().is_due_array(index, where)
+        positions = np.arange(len(index)) if where is None else np.flatnonzero(where)
+        times = index[positions]
+        times_ns = times.asi8
+        period_ns = pd.Timedelta(self.period).value
+        due = np.zeros(len(index), dtype=bool)
+        # Jump straight from each event to the first datetime at or after the next
+        j = times.searchsorted(self.next_periodic_event)
+        last = None
+        while j < len(times):
+            due[positions[j]] = True
+            last = j
+            j = max(times_ns.searchsorted(times_ns[j] + period_ns), j + 1)
+        if last is not None:
+            self.next_periodic_event = times[last] + self.period
+        return due
+
 
 @dataclass
 class SpecificEvents(EventOccurrence):
@@ -76,17 +190,25 @@ class SpecificEvents(EventOccurrence):
     def is_due(self, dt):
         return dt in self.events
 
+    def is_due_array(self, index: pd.DatetimeIndex, where: np.ndarray = None) -> np.ndarray:
+        due = index.isin(list(self.events))
+        return due if where is None else due & where
+
 
 @dataclass
 class SpecificHourDailyEvents(EventOccurrence, DailyHours):
     def is_due(self, dt: datetime):
         due = False
         if self.relevant_day(dt):
-            if dt.hour in self.hours:
+            if self.relevant_hour(dt):
                 if dt.minute == 0:
                     due = True
         return due
 
+    def is_due_array(self, index: pd.DatetimeIndex, where: np.ndarray = None) -> np.ndarray:
+        due = self.active_array(index) & (index.minute == 0)
+        return due if where is None else due & where
+
 
 @dataclass
 class EventSchedule:
@@ -105,6 +227,18 @@ class EventSchedule:
                 due = True if occurrence.is_due(dt) else due
         return due
 
+    def event_due_array(self, index: pd.DatetimeIndex, where: np.ndarray = None) -> np.ndarray:
+        """ event_due evaluated in order for each datetime in index. Where a mask
+        is given, datetimes outside of it are not evaluated and are never due
+        """
+        if self.always_due:
+            return np.ones(len(index), dtype=bool) if where is None else where.copy()
+        due = np.zeros(len(index), dtype=bool)
+        # Occurrences are independent so each can be evaluated over the whole index
+        for occurrence in self.event_occurrences:
+            due |= occurrence.is_due_array(index, where)
+        return due
+
     @classmethod
     def from_daily_hours(
         cls,
@@ -155,16 +289,26 @@ class Period(ABC):
     def period_active(self, dt: datetime):
         pass
 
+    def period_active_array(self, index: pd.DatetimeIndex) -> np.ndarray:
+        return np.fromiter(
+            (self.period_active(dt) for dt in index),
+            dtype=bool,
+            count=len(index)
+        )
+
 
 @dataclass
 class DailyPeriod(Period, DailyHours):
     def period_active(self, dt: datetime):
         active = False
         if self.relevant_day(dt):
-            if dt.hour in self.hours:
+            if self.relevant_hour(dt):
                 active = True
         return active
 
+    def period_active_array(self, index: pd.DatetimeIndex) -> np.ndarray:
+        return self.active_array(index)
+
 
 @dataclass
 class DateRangePeriod(Period):
@@ -177,6 +321,13 @@ class DateRangePeriod(Period):
             active = True
         return active
 
+    def period_active_array(self, index: pd.DatetimeIndex) -> np.ndarray:
+        if not index.is_monotonic_increasing:
+            return super().period_active_array(index)
+        active = np.zeros(len(index), dtype=bool)
+        active[index.searchsorted(self.from_date):index.searchsorted(self.to_date)] = True
+        return active
+
 
 @dataclass
 class PeriodSchedule:
@@ -184,23 +335,62 @@ class PeriodSchedule:
     pause_period: List[Period] = None
     always_active: bool = False
 
+    # Date ranges among periods sorted by start, for binary search
+    _range_lookup: Tuple[list, list, list] = field(init=False, default=None, repr=False, compare=False)
+    _range_lookup_key: tuple = field(init=False, default=None, repr=False, compare=False)
+
     def __post_init__(self):
         if not self.periods:
             self.periods = []
         if not self.pause_period:
             self.pause_period = []
 
+    def range_lookup(self) -> Tuple[list, list, list]:
+        """ Starts of the DateRangePeriods in periods in ascending order, the
+        latest end of the ranges up to each start and the other periods.
+        Rebuilt whenever periods are added, removed or replaced. Bounds of a
+        DateRangePeriod are taken as fixed once it is in the schedule
+        """
+        key = tuple(self.periods)
+        if key != self._range_lookup_key:
+            ranges = sorted(
+                ((period.from_date, period.to_date) for period in key
+                 if type(period) is DateRangePeriod),
+                key=lambda date_range: date_range[0]
+            )
+            self._range_lookup = (
+                [from_date for from_date, _ in ranges],
+                list(accumulate((to_date for _, to_date in ranges), max)),
+                [period for period in key if type(period) is not DateRangePeriod]
+            )
+            self._range_lookup_key = key
+        return self._range_lookup
+
     def period_active(self, dt: datetime) -> bool:
         if self.always_active:
             active = True
         else:
-            active = False
-            for period in self.periods:
+            starts, latest_ends, other_periods = self.range_lookup()
+            # Within a range where one started at or before dt and has not yet ended
+            i = bisect_right(starts, dt)
+            active = i > 0 and dt < latest_ends[i - 1]
+            for period in other_periods:
                 active = True if period.period_active(dt) else active
         for pause_period in self.pause_period:
             active = False if pause_period.period_active(dt) else active
         return active
 
+    def period_active_array(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """ period_active for each datetime in index
+        """
+        active = np.full(len(index), self.always_active)
+        if not self.always_active:
+            for period in self.periods:
+                active |= period.period_active_array(index)
+        for pause_period in self.pause_period:
+            active &= ~pause_period.period_active_array(index)
+        return active
+
     def add_period(self, period: Period):
         self.periods.append(period)
 
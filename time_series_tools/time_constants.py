@@ -0,0 +1,5 @@
+from datetime import timedelta
+
+MINUTE_NS = 60 * 10 ** 9
+# Divisor for timestep hours - constructing timedelta(hours=1) per call is slow
+HOUR = timedelta(hours=1)
@@ -3,7 +3,6 @@ from dataclasses import dataclass
 
 import pandas as pd
 import numpy as np
-from scipy.signal import find_peaks
 
 from ts_tariffs.sites import MeterData
 
@@ -50,6 +49,9 @@ class MarketPrices(MeterData):
         Validator.data_cols(self.tseries, MARKET_PRICE_COLS)
 
     def forecast_turning_point_pairs(self, dt: datetime):
+        # scipy.signal takes longer to import than the rest of the package
+        # and is only needed here
+        from scipy.signal import find_peaks
         forecast = self.forecaster.look_ahead(self.tseries, dt)
         peaks = find_peaks(forecast['price'], height=0.0)
         troughs = find_peaks(-forecast['price'], height=0.0)